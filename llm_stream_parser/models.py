@@ -12,7 +12,8 @@ class StreamMessage(BaseModel):
     Represents a parsed message from the streaming LLM response.
 
     Attributes:
-        step: Step number (auto-incremented per step_name)
+        step: Step number (auto-incremented per step_name); streaming partials of one
+              block and that block's complete message share the same step
         step_name: Name of the step (e.g., "思考", "工具调用", "回答")
         title: Optional title for the message
         content: The content of the message
@@ -1,12 +1,124 @@
-import asyncio
+import io
 import re
-from typing import AsyncGenerator, List, Optional, Dict, Tuple
+from functools import lru_cache
+from types import MappingProxyType
+from typing import AsyncGenerator, Dict, FrozenSet, List, Mapping, NamedTuple, Optional, Tuple
 
 from llm_stream_parser import StreamMessage
 
+# 有效的标签名：以字母或下划线开头（与XML名称规则一致），只包含ASCII字母、数字、下划线和连字符
+_TAG_NAME_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_-]*\Z')
+
+
+class _ContentSink:
+    """
+    内容累积器：以 io.StringIO 写缓冲区代替 str += 拼接，避免长内容反复拷贝前缀
+
+    新写入的分片先暂存在列表中，读取尾部增量时直接返回这些分片（只有一片时不拷贝），
+    再转入 StringIO；StringIO 只追加、从不回读，始终保持高效的累积模式。
+    长度通过计数器以 O(1) 给出。
+    """
+
+    __slots__ = ("_buf", "_flushed", "_pending", "_length")
+
+    def __init__(self) -> None:
+        self._buf = io.StringIO()
+        # 已转入 StringIO 的长度，之后的内容暂存在 _pending 中
+        self._flushed = 0
+        self._pending: List[str] = []
+        self._length = 0
+
+    def append(self, text: str) -> None:
+        self._pending.append(text)
+        self._length += len(text)
+
+    def clear(self) -> None:
+        self._buf = io.StringIO()
+        self._flushed = 0
+        self._pending = []
+        self._length = 0
+
+    def _flush(self) -> str:
+        text = "".join(self._pending)
+        self._buf.write(text)
+        self._flushed = self._length
+        self._pending = []
+        return text
+
+    def read_from(self, offset: int) -> str:
+        """读取从 offset 开始到末尾的内容"""
+        if offset == self._flushed:
+            # 常见情况：offset 恰好是上次读取的位置，增量就是暂存的分片
+            return self._flush()
+        self._flush()
+        return self._buf.getvalue()[offset:]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        self._flush()
+        return self._buf.getvalue()
+
+
+def _scan_tags(buffer: str, pos: int, tag_pattern: re.Pattern) -> List[Tuple[int, int, bool, str]]:
+    """
+    从 pos 开始扫描 buffer 中所有完整的已知标签
+
+    先用 str.find 判断是否存在 '<'，不含 '<' 的纯内容直接返回；
+    否则从第一个 '<' 开始交给预编译的标签正则在 C 层扫描，
+    内容中大量不是标签的 '<'（如嵌套的 XML 工具调用）不会逐个回到 Python 层判断。
+
+    Args:
+        buffer: 待扫描的文本
+        pos: 起始扫描位置
+        tag_pattern: 匹配所有已知标签的正则，见 StreamParser._create_tag_pattern
+
+    Returns:
+        按出现顺序排列的 (标签起始位置, 标签结束位置, 是否为闭合标签, 标签名) 列表
+    """
+    pos = buffer.find("<", pos)
+    if pos < 0:
+        return []
+
+    matches: List[Tuple[int, int, bool, str]] = []
+    for match in tag_pattern.finditer(buffer, pos):
+        start, end = match.span()
+        slash, tag_name = match.groups()
+        matches.append((start, end, slash == "/", tag_name))
+    return matches
+
+
+class _ParserConfig(NamedTuple):
+    """
+    由标签配置派生出的不可变数据，同一组标签的所有解析器实例共享一份
+    """
+    # states、tag_map、state_to_step 是实例的公开属性，使用只读映射，避免修改一个实例影响其他实例和缓存
+    states: Mapping[str, str]
+    tag_map: Mapping[str, Tuple[str, str]]
+    tag_pattern: re.Pattern
+    state_to_step: Mapping[str, str]
+    step_name_to_id: Dict[str, int]
+    state_steps: Dict[str, Tuple[str, int]]
+    tag_transitions: Dict[str, Tuple[str, Tuple[str, int]]]
+    tag_prefixes: FrozenSet[str]
+    max_tag_len: int
+
 
 # 核心解析器类
 class StreamParser:
+    # 固定实例属性布局，不为每个解析器创建 __dict__；新增实例属性时需同步加入
+    __slots__ = (
+        # 标签配置
+        "tags", "enable_tags_streaming",
+        # 由标签配置派生、实例间共享的数据
+        "_config", "states", "tag_map", "tag_pattern", "state_to_step", "_max_tag_len",
+        "_step_name_to_id", "_state_steps", "_tag_transitions", "_tag_prefixes", "_no_tags",
+        # 解析状态，由 reset() 初始化
+        "buffer", "current_state", "_is_idle", "_content", "step_counter", "last_sent_len",
+        "_step_counts", "_current_step",
+    )
+
     def __init__(self, tags: Optional[Dict[str, str]] = None, enable_tags_streaming: bool = False):
         """
         初始化流式解析器
@@ -23,21 +135,63 @@ class StreamParser:
         self.tags = self._validate_tags(tags or {})
         self.enable_tags_streaming = enable_tags_streaming
 
-        # 初始化基本状态
+        self._compile_tags()
+        self.reset()
+
+    def _compile_tags(self) -> None:
+        """
+        取得当前标签配置对应的不可变数据
+
+        状态、映射、正则只依赖标签配置，按配置缓存后在实例间共享
+        """
+        self._config = self._build_config(tuple(self.tags.items()))
+        self.states = self._config.states
+        self.tag_map = self._config.tag_map
+        self.tag_pattern = self._config.tag_pattern
+        self.state_to_step = self._config.state_to_step
+        self._max_tag_len = self._config.max_tag_len
+        self._step_name_to_id = self._config.step_name_to_id
+        self._state_steps = self._config.state_steps
+        self._tag_transitions = self._config.tag_transitions
+        self._tag_prefixes = self._config.tag_prefixes
+        # 没有定义标签时不存在标签边界，parse_chunk 走快速路径
+        self._no_tags = not self.tags
+
+    def reset(self) -> None:
+        """
+        重置解析状态，使解析器可以从头解析一个新的流
+
+        只清空缓冲区、当前状态、内容和step计数，不会重新验证标签或重建配置
+        """
         self.buffer = ""
         self.current_state = "IDLE"
-        self.current_content = ""
+        # 缓存 current_state == "IDLE" 的判断结果，随状态切换同步更新
+        self._is_idle = True
+        self._content = _ContentSink()
         self.step_counter = 0
-        self.last_sent_content = ""
-        # 用于跟踪每个step_name的step计数
-        self.step_counters = {}
-
-        # 动态生成状态和映射
-        self.states = self._generate_states()
-        self.tag_map = self._create_tag_map()
-        self.tag_pattern = self._create_tag_pattern()
-
-    def _validate_tags(self, tags: Dict[str, str]) -> Dict[str, str]:
+        # 当前块中已发送内容的长度，只记偏移量，不保留已发送内容的副本
+        self.last_sent_len = 0
+        # 每个step_name的step计数，按步骤名编号索引
+        self._step_counts = [0] * len(self._step_name_to_id)
+        # 当前块的 (步骤名, 步骤名编号)，随状态切换同步更新，生成消息时无需再查表
+        self._current_step = self._state_steps["IDLE"]
+
+    @property
+    def current_content(self) -> str:
+        """当前块已累积的内容"""
+        return str(self._content)
+
+    @property
+    def step_counters(self) -> Dict[str, int]:
+        """每个已出现的step_name当前的step计数"""
+        return {
+            step_name: self._step_counts[step_id]
+            for step_name, step_id in self._step_name_to_id.items()
+            if self._step_counts[step_id]
+        }
+
+    @staticmethod
+    def _validate_tags(tags: Dict[str, str]) -> Dict[str, str]:
         """
         验证标签配置的有效性
 
@@ -58,8 +212,8 @@ class StreamParser:
                 raise ValueError(f"标签名必须是非空字符串，得到: {tag_name}")
 
             # 检查标签名格式（应该是有效的XML标签名）
-            if not re.match(r'^[a-zA-Z][a-zA-Z0-9_-]*$', tag_name):
-                raise ValueError(f"标签名 '{tag_name}' 格式无效，应只包含字母、数字、下划线和连字符，且以字母开头")
+            if not _TAG_NAME_RE.match(tag_name):
+                raise ValueError(f"标签名 '{tag_name}' 格式无效，应只包含字母、数字、下划线和连字符，且以字母或下划线开头")
 
             # 检查步骤名
             if not step_name or not isinstance(step_name, str):
@@ -69,61 +223,129 @@ class StreamParser:
 
         return validated_tags
 
-    def _generate_states(self) -> Dict[str, str]:
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _build_config(tag_items: Tuple[Tuple[str, str], ...]) -> _ParserConfig:
+        """
+        根据已验证的标签配置构建解析器的不可变数据，相同配置只构建一次
+
+        Args:
+            tag_items: 标签字典的 (标签名, 步骤名) 元组，作为缓存键
+
+        Returns:
+            解析器配置
+        """
+        tags = dict(tag_items)
+        states = StreamParser._generate_states(tags)
+        tag_map = StreamParser._create_tag_map(tags, states)
+
+        # 状态到步骤名的反向映射，避免每次查找都遍历 tag_map
+        state_to_step = dict(tag_map.values())
+        state_to_step["IDLE"] = "回答"
+        # 步骤名集合在构造时就已确定，为每个步骤名分配一个编号，用于索引step计数
+        step_name_to_id: Dict[str, int] = {}
+        for step_name in state_to_step.values():
+            step_name_to_id.setdefault(step_name, len(step_name_to_id))
+        state_steps = {state: (name, step_name_to_id[name]) for state, name in state_to_step.items()}
+        # 标签名到 (状态, 步骤) 的直接映射，遇到标签时查一次表即可完成状态切换
+        tag_transitions = {tag: (state, state_steps[state]) for tag, (state, _) in tag_map.items()}
+
+        return _ParserConfig(
+            states=MappingProxyType(states),
+            tag_map=MappingProxyType(tag_map),
+            tag_pattern=StreamParser._create_tag_pattern(tags),
+            state_to_step=MappingProxyType(state_to_step),
+            step_name_to_id=step_name_to_id,
+            state_steps=state_steps,
+            tag_transitions=tag_transitions,
+            # 所有标签字面量（<think>、</think> 等）的真前缀，用于判断 buffer 末尾是否可能是不完整的标签
+            tag_prefixes=frozenset(
+                literal[:i]
+                for tag in tags
+                for literal in (f"<{tag}>", f"</{tag}>")
+                for i in range(1, len(literal))
+            ),
+            # 一个标签字面量（如 </think>）的最大长度，跨 chunk 时只需回看这么多字符
+            max_tag_len=max(len(tag) for tag in tags) + 3 if tags else 0,
+        )
+
+    @staticmethod
+    def _generate_states(tags: Dict[str, str]) -> Dict[str, str]:
         """
         动态生成状态常量
 
+        Args:
+            tags: 已验证的标签字典
+
         Returns:
             状态字典，包含IDLE和每个标签对应的状态
         """
         states = {"IDLE": "IDLE"}
 
-        for tag_name in self.tags.keys():
+        for tag_name in tags.keys():
             state_name = f"IN_{tag_name.upper()}_BLOCK"
             states[state_name] = state_name
 
         return states
 
-    def _create_tag_map(self) -> Dict[str, Tuple[str, str]]:
+    @staticmethod
+    def _create_tag_map(tags: Dict[str, str], states: Dict[str, str]) -> Dict[str, Tuple[str, str]]:
         """
         创建从标签名到(状态, 步骤名)的映射
 
+        Args:
+            tags: 已验证的标签字典
+            states: 状态字典
+
         Returns:
             标签映射字典
         """
         tag_map = {}
 
-        for tag_name, step_name in self.tags.items():
+        for tag_name, step_name in tags.items():
             state_name = f"IN_{tag_name.upper()}_BLOCK"
-            tag_map[tag_name] = (self.states[state_name], step_name)
+            tag_map[tag_name] = (states[state_name], step_name)
 
         return tag_map
 
-    def _create_tag_pattern(self) -> re.Pattern:
+    @staticmethod
+    def _create_tag_pattern(tags: Dict[str, str]) -> re.Pattern:
         """
         创建用于匹配所有已知标签的正则表达式
 
+        Args:
+            tags: 已验证的标签字典
+
         Returns:
             编译后的正则表达式模式
         """
-        if not self.tags:
+        if not tags:
             # 如果没有定义任何标签，则创建一个永不匹配的正则
             return re.compile(r"(?!a)a")
 
-        # 获取所有标签名并转义，以防标签名包含正则特殊字符
-        known_tags = [re.escape(tag) for tag in self.tags.keys()]
+        # 标签名已验证只包含字母、数字、下划线和连字符，不含正则特殊字符，无需转义；
+        # 按长度降序排列，使 thinker 这类较长的标签名排在其前缀 think 之前
+        known_tags = sorted(tags.keys(), key=len, reverse=True)
         # 构建模式，例如: <(\/?)(think|tool|result)>
         tag_pattern_str = f"<(/?)({'|'.join(known_tags)})>"
         return re.compile(tag_pattern_str)
 
-    def _generate_message(self, step_name: str, content: str, is_complete: bool = True) -> Optional[StreamMessage]:
+    def _generate_message(
+            self,
+            step: Tuple[str, int],
+            content: str,
+            is_complete: bool = True,
+            increment: bool = True
+    ) -> Optional[StreamMessage]:
         """
         内部方法：生成并返回一个 StreamMessage
 
         Args:
-            step_name: 步骤名称
+            step: (步骤名称, 步骤名编号)
             content: 内容
             is_complete: 标签是否闭合（True表示闭合，False表示流式输出）
+            increment: 是否开始一个新步骤；同一块内容的后续流式消息和闭合消息
+                       沿用该块第一条消息的step，不再递增
 
         Returns:
             生成的StreamMessage对象，如果内容为空则返回None
@@ -131,13 +353,14 @@ class StreamParser:
         if not content:
             return None
 
-        # 按step_name分组计数step
-        if step_name not in self.step_counters:
-            self.step_counters[step_name] = 0
-        self.step_counters[step_name] += 1
+        # 按step_name分组计数step，每个逻辑步骤只递增一次
+        step_name, step_id = step
+        step_counts = self._step_counts
+        if increment or not step_counts[step_id]:
+            step_counts[step_id] += 1
 
         return StreamMessage(
-            step=self.step_counters[step_name],
+            step=step_counts[step_id],
             step_name=step_name,
             content=content,
             is_complete=is_complete
@@ -151,36 +374,38 @@ class StreamParser:
             messages: 要添加消息的列表
         """
         # 如果没有启用标签流式输出，且当前不在IDLE状态，则不发送部分消息
-        if not self.enable_tags_streaming and self.current_state != "IDLE":
+        if not self.enable_tags_streaming and not self._is_idle:
             return
 
-        if self.current_content == self.last_sent_content:
-            return
+        # 无论是否在标签块内，部分消息都是流式的（未完整）
+        message = self._emit_delta(is_complete=False)
+        if message:
+            messages.append(message)
 
-        # 计算新增内容（自上次发送以来的增量）
-        # 只发送 current_content 中超出 last_sent_content 长度的部分
-        last_len = len(self.last_sent_content)
-        new_content = self.current_content[last_len:]
+    def _emit_delta(self, is_complete: bool) -> Optional[StreamMessage]:
+        """
+        为当前块中自上次发送以来的新增内容生成一条消息，并记录已发送的位置
 
-        if not new_content:
-            return
+        Args:
+            is_complete: 标签是否闭合（True表示闭合，False表示流式输出）
 
-        # 根据当前状态确定步骤名称和是否完整
-        if self.current_state == "IDLE":
-            step_name = "回答"
-            is_complete = False  # IDLE状态下的内容也是流式的
-        else:
-            step_name = next(
-                (name for state, name in self.tag_map.values() if state == self.current_state),
-                "未知"
-            )
-            is_complete = False  # 标签块内的内容也是流式的
+        Returns:
+            生成的StreamMessage对象，如果没有新增内容则返回None
+        """
+        # 只发送 current_content 中超出 last_sent_len 的部分
+        last_sent_len = self.last_sent_len
+        if len(self._content) == last_sent_len:
+            return None
 
-        message = self._generate_message(step_name, new_content, is_complete=is_complete)
-        if message:
-            messages.append(message)
-            # 立即更新last_sent_content，避免重复发送
-            self.last_sent_content = self.current_content
+        message = self._generate_message(
+            self._current_step,
+            self._content.read_from(last_sent_len),
+            is_complete=is_complete,
+            increment=last_sent_len == 0
+        )
+        # 立即更新last_sent_len，避免重复发送
+        self.last_sent_len = len(self._content)
+        return message
 
     def parse_chunk(self, chunk: str) -> List[StreamMessage]:
         """
@@ -190,82 +415,98 @@ class StreamParser:
             chunk: 要解析的文本块
 
         Returns:
-            解析出的StreamMessage列表
+            解析出的StreamMessage列表，不包含 None 或内容为空的消息
         """
-        self.buffer += chunk
-        messages = []
+        if self._no_tags:
+            return self._parse_chunk_no_tags(chunk)
+
+        messages: List[StreamMessage] = []
+        if not self.buffer and "<" not in chunk:
+            # 没有滞留的不完整标签，且 chunk 中没有 '<'：不可能出现标签，整个 chunk 都是内容
+            if chunk:
+                self._content.append(chunk)
+                self._maybe_emit_partial(messages)
+            return messages
+
+        # 上一轮保留的 buffer 只有不足一个标签长度的不完整标签，从头扫描即可
+        buffer = self.buffer + chunk
         last_pos = 0
         content_added = False  # 标记是否有新内容添加
+        # 循环中反复用到的属性绑定为局部变量；clear() 原地清空，块切换后仍是同一个对象
+        content = self._content
+        tag_transitions = self._tag_transitions
+        generate_message = self._generate_message
 
         # 在缓冲区中查找所有完整的、我们关心的标签
-        for match in self.tag_pattern.finditer(self.buffer):
-            start, end = match.span()
-            is_closing_tag = match.group(1) == '/'
-            tag_name = match.group(2)
-
+        for start, end, is_closing_tag, tag_name in _scan_tags(buffer, 0, self.tag_pattern):
             # 1. 处理标签之前的文本内容
-            text_before_tag = self.buffer[last_pos:start]
+            text_before_tag = buffer[last_pos:start]
             if text_before_tag:
-                self.current_content += text_before_tag
+                content.append(text_before_tag)
                 content_added = True
 
             # 2. 处理标签本身，进行状态转换
             if is_closing_tag:
-                expected_state, step_name = self.tag_map.get(tag_name, (None, None))
+                expected_state, _ = tag_transitions[tag_name]
                 if self.current_state == expected_state:
                     # 生成完整消息时，使用当前内容的完整副本
-                    message = self._generate_message(step_name, self.current_content, is_complete=True)
+                    message = generate_message(
+                        self._current_step, str(content), is_complete=True, increment=self.last_sent_len == 0
+                    )
                     if message:
                         messages.append(message)
 
                     self.current_state = "IDLE"
-                    self.current_content = ""
-                    self.last_sent_content = ""
+                    self._is_idle = True
+                    self._current_step = self._state_steps["IDLE"]
+                    content.clear()
+                    self.last_sent_len = 0
                     content_added = False  # 重置标记，因为内容已经被处理
             else:
                 # 在切换到新状态之前，先处理掉当前已经累积的内容
-                if self.current_content:
-                    if self.current_state == "IDLE":
-                        step_name_for_old_content = "回答"
-                    else:
-                        # 如果当前在某个标签状态中，使用该标签的步骤名
-                        step_name_for_old_content = next(
-                            (name for state, name in self.tag_map.values() if state == self.current_state),
-                            "回答"
-                        )
+                if content:
                     # 生成完整消息时，使用当前内容的完整副本
-                    message = self._generate_message(step_name_for_old_content, self.current_content, is_complete=True)
+                    message = generate_message(
+                        self._current_step,
+                        str(content),
+                        is_complete=True,
+                        increment=self.last_sent_len == 0
+                    )
                     if message:
                         messages.append(message)
 
-                new_state, step_name = self.tag_map.get(tag_name, ("IDLE", "回答"))
+                new_state, self._current_step = tag_transitions[tag_name]
                 self.current_state = new_state
-                self.current_content = ""
-                self.last_sent_content = ""
+                self._is_idle = False
+                content.clear()
+                self.last_sent_len = 0
                 content_added = False  # 重置标记，因为内容已经被处理
 
             last_pos = end
 
         # 3. 处理剩余的文本（没有匹配到标签的部分）
-        remaining_text = self.buffer[last_pos:]
+        remaining_text = buffer[last_pos:]
 
         # 4. 检查剩余内容是否可能是不完整的标签
-        # 查找最后一个 '<' 的位置，它可能是不完整标签的开始
-        potential_tag_start = remaining_text.rfind('<')
+        # 不完整的标签一定比最长的标签字面量短，所以只在末尾这段范围内查找最后一个 '<'，
+        # 更早的 '<' 之后的内容都可以确定是普通内容，不必滞留在 buffer 中
+        tail_start = len(remaining_text) - self._max_tag_len + 1
+        potential_tag_start = remaining_text.rfind('<', tail_start if tail_start > 0 else 0)
 
-        if potential_tag_start >= 0:
+        # 标签字面量中只有一个 '<'，所以只需检查最后一个 '<' 之后的部分是否为某个标签的前缀
+        if potential_tag_start >= 0 and remaining_text[potential_tag_start:] in self._tag_prefixes:
             # 有可能是不完整的标签
             # 把 '<' 之前的内容加到 current_content
             safe_content = remaining_text[:potential_tag_start]
             if safe_content:
-                self.current_content += safe_content
+                content.append(safe_content)
                 content_added = True
             # 保留 '<' 及之后的内容在 buffer 中，等待下一个 chunk
             self.buffer = remaining_text[potential_tag_start:]
         else:
             # 没有可能是不完整的标签，把所有内容加到 current_content
             if remaining_text:
-                self.current_content += remaining_text
+                content.append(remaining_text)
                 content_added = True
             self.buffer = ""
 
@@ -276,6 +517,24 @@ class StreamParser:
         return messages
 
 
+    def _parse_chunk_no_tags(self, chunk: str) -> List[StreamMessage]:
+        """
+        没有定义标签时的 parse_chunk：不扫描标签，也无需保留可能不完整的标签，
+        整个 chunk 就是新增内容，直接作为流式回答输出
+
+        Args:
+            chunk: 要解析的文本块
+
+        Returns:
+            解析出的StreamMessage列表
+        """
+        if not chunk:
+            return []
+
+        self._content.append(chunk)
+        message = self._emit_delta(is_complete=False)
+        return [message] if message else []
+
     def finalize(self) -> Optional[StreamMessage]:
         """
         当流结束时，调用此方法处理缓冲区中剩余的内容
@@ -285,26 +544,11 @@ class StreamParser:
         """
         # 把 buffer 中剩余的内容加到 current_content
         if self.buffer:
-            self.current_content += self.buffer
+            self._content.append(self.buffer)
             self.buffer = ""
 
-        # 计算新增内容（自上次发送以来的增量）
-        last_len = len(self.last_sent_content)
-        new_content = self.current_content[last_len:]
-
-        # 如果没有新内容，返回 None
-        if not new_content:
-            return None
-
-        if self.current_state == "IDLE":
-            step_name = "回答"
-        else:
-            step_name = next(
-                (name for state, name in self.tag_map.values() if state == self.current_state),
-                "未知"
-            )
-
-        return self._generate_message(step_name, new_content, is_complete=True)
+        # 输出自上次发送以来的新增内容，如果没有新内容则返回 None
+        return self._emit_delta(is_complete=True)
 
 
 # 流式处理包装函数
@@ -332,3 +576,4 @@ async def process_llm_stream(
     final_message = parser.finalize()
     if final_message:
         yield final_message
+
@@ -165,7 +165,7 @@ class TestStreamParser:
 
         # 断言：空标签不应该生成消息
         empty_messages = [msg for msg in messages if msg and not msg.content.strip()]
-        # 注意：当前实现中空内容不会生成消息，所以这里不需要特别检查
+        assert empty_messages == [], "空标签不应该生成消息"
 
     # 测试用例5: 大量数据测试（断言版）
     async def test_large_data_with_assertions(self):
@@ -310,6 +310,22 @@ class TestStreamParser:
         except ValueError as e:
             assert "格式无效" in str(e)
 
+        # 末尾带换行符
+        try:
+            parser = StreamParser(tags={"tag\n": "步骤名"})
+            assert False, "应该抛出ValueError"
+        except ValueError as e:
+            assert "格式无效" in str(e)
+
+    async def test_valid_tag_names(self):
+        """测试合法的标签名格式"""
+        tags = {"tool_call": "下划线", "tool-call": "连字符", "ToolCall": "大小写", "_private": "下划线开头"}
+        parser = StreamParser(tags=tags)
+        assert parser.tags == tags
+
+        messages = parser.parse_chunk("<_private>内容</_private>")
+        assert [(msg.step_name, msg.content) for msg in messages] == [("下划线开头", "内容")]
+
     async def test_invalid_step_name_empty(self):
         """测试空步骤名应该抛出ValueError"""
         try:
@@ -337,6 +353,16 @@ class TestStreamParser:
         assert messages[0].step_name == "回答"
         assert "这是一些内容" in messages[0].content
 
+    async def test_no_tags_emits_lt_immediately(self):
+        """测试没有定义标签时，包含 '<' 的内容不会被当作不完整标签而滞留"""
+        parser = StreamParser(tags=None)
+
+        messages = parser.parse_chunk("比较 a <b")
+        assert len(messages) == 1
+        assert messages[0].content == "比较 a <b", "没有标签时 '<' 之后的内容应该立即输出"
+        assert parser.parse_chunk("") == [], "空chunk不应该产生消息"
+        assert parser.finalize() is None, "所有内容都已输出，finalize不应该再产生消息"
+
     async def test_enable_tags_streaming_no_content_change(self):
         """测试启用标签流式输出但内容没有变化的情况"""
         parser = StreamParser(tags={"think": "思考"}, enable_tags_streaming=True)
@@ -371,6 +397,46 @@ class TestStreamParser:
         assert "思考" in step_names
         assert any("这是思考内容" in msg.content for msg in messages)
 
+    async def test_streaming_step_counted_once_per_block(self):
+        """测试流式输出时，同一块的部分消息和闭合消息共用一个step"""
+        parser = StreamParser(tags={"think": "思考"}, enable_tags_streaming=True)
+
+        messages = []
+        for chunk in ["<think>第一", "次思考</think>", "回答", "<think>第二次", "思考</think>"]:
+            messages.extend(parser.parse_chunk(chunk))
+
+        think_steps = [(msg.step, msg.is_complete) for msg in messages if msg.step_name == "思考"]
+        assert think_steps == [(1, False), (1, True), (2, False), (2, True)], \
+            "同一块内的消息应该共用step，新的块才递增"
+        complete_messages = [msg for msg in messages if msg.step_name == "思考" and msg.is_complete]
+        assert [msg.content for msg in complete_messages] == ["第一次思考", "第二次思考"], "闭合消息应该包含完整内容"
+        answer_steps = [msg.step for msg in messages if msg.step_name == "回答"]
+        assert answer_steps and set(answer_steps) == {1}, "回答块的消息应该共用step"
+
+    async def test_finalize_is_idempotent(self):
+        """测试重复调用 finalize 不会重复输出剩余内容"""
+        parser = StreamParser(tags={"think": "思考"})
+        parser.parse_chunk("<think>未闭合的思考")
+
+        final_message = parser.finalize()
+        assert final_message is not None
+        assert final_message.content == "未闭合的思考"
+        assert final_message.is_complete is True
+        assert parser.finalize() is None, "剩余内容已经输出过，不应该再次输出"
+
+    async def test_no_empty_messages_emitted(self):
+        """测试解析器从不返回 None 或内容为空的消息，调用方无需再过滤"""
+        text = "<think></think><tool></tool>答案<think></think></tool><tool>x</tool>"
+        for enable_tags_streaming in (False, True):
+            for size in (1, 3, len(text)):
+                parser = StreamParser(tags={"think": "思考", "tool": "工具"}, enable_tags_streaming=enable_tags_streaming)
+                messages = []
+                for i in range(0, len(text), size):
+                    messages.extend(parser.parse_chunk(text[i:i + size]))
+                assert all(msg is not None and msg.content for msg in messages), "不应该返回空消息"
+                assert parser.finalize() is None, "没有剩余内容时 finalize 应该返回 None"
+                assert "".join(msg.content for msg in messages if msg.is_complete) == "答案x"
+
     async def test_nested_tag_switch(self):
         """测试标签切换时的旧内容处理（覆盖第232行）"""
         parser = StreamParser(tags={"think": "思考", "tool": "工具"})
@@ -448,6 +514,124 @@ class TestStreamParser:
         assert messages[0].is_complete == False
         assert messages[0].content == "内容"
 
+    async def test_stray_lt_then_tag_across_chunks(self):
+        """测试内容中出现孤立的 '<' 后，跨 chunk 的标签仍能被识别"""
+        parser = StreamParser(tags={"think": "思考"})
+
+        chunks = ["a < b ", "比较" * 50, "<thi", "nk>思考", "内容</th", "ink>结束"]
+
+        messages = []
+        for chunk in chunks:
+            messages.extend(parser.parse_chunk(chunk))
+        final_message = parser.finalize()
+        if final_message:
+            messages.append(final_message)
+
+        answer_messages = [msg for msg in messages if msg.step_name == "回答" and msg.is_complete]
+        assert answer_messages[0].content == "a < b " + "比较" * 50, "标签前的内容应该完整保留"
+        assert messages[-1].content == "结束", "标签后的内容应该被输出"
+        think_messages = [msg for msg in messages if msg.step_name == "思考"]
+        assert len(think_messages) == 1, "应该只有一条思考消息"
+        assert think_messages[0].content == "思考内容", "思考内容应该完整"
+
+    async def test_every_split_point_gives_same_blocks(self):
+        """测试在任意位置切分 chunk，解析出的完整消息都与不切分时一致"""
+        tags = {"think": "思考", "thinker": "深度思考", "tool": "工具调用"}
+        text = "开头<<think>a<b</think><thinker>深<</thinker>x</tool><tool>t</too</tool>尾<"
+
+        def complete_messages(chunks):
+            parser = StreamParser(tags=tags)
+            messages = []
+            for chunk in chunks:
+                messages.extend(parser.parse_chunk(chunk))
+            final_message = parser.finalize()
+            if final_message:
+                messages.append(final_message)
+            return [(msg.step_name, msg.content) for msg in messages if msg.step_name != "回答"]
+
+        expected = complete_messages([text])
+        assert expected == [("思考", "a<b"), ("深度思考", "深<"), ("工具调用", "t</too")]
+        for i in range(1, len(text)):
+            for j in range(i, len(text)):
+                assert complete_messages([text[:i], text[i:j], text[j:]]) == expected, f"在 {i},{j} 处切分结果不一致"
+
+    async def test_buffer_keeps_only_possible_tag_tail(self):
+        """测试 buffer 只保留可能是不完整标签的末尾，孤立 '<' 之后的长内容会立即输出"""
+        parser = StreamParser(tags={"think": "思考"})
+
+        messages = parser.parse_chunk("a <" + "很长的内容" * 20)
+        assert parser.buffer == "", "远离末尾的 '<' 不可能是不完整标签"
+        assert messages[0].content == "a <" + "很长的内容" * 20, "内容应该立即输出"
+
+        messages = parser.parse_chunk("结尾 </thi")
+        assert parser.buffer == "</thi", "末尾可能是不完整标签的部分应该保留"
+        assert messages[0].content == "结尾 "
+
+    async def test_non_tag_tail_not_held_back(self):
+        """测试末尾的 '<' 之后不是任何标签的前缀时，不再滞留在 buffer 中"""
+        parser = StreamParser(tags={"think": "思考"})
+
+        messages = parser.parse_chunk("比较 a<b")
+        assert parser.buffer == "", "'<b' 不可能是标签的开头，应该立即输出"
+        assert messages[0].content == "比较 a<b"
+
+        for tail in ("<", "</", "<th", "</think"):
+            parser.parse_chunk("x" + tail)
+            assert parser.buffer == tail, f"'{tail}' 可能是不完整的标签，应该保留"
+            parser.finalize()
+            parser.reset()
+
+        parser.parse_chunk("x<thx")
+        assert parser.buffer == "", "'<thx' 不是标签的前缀"
+
+    async def test_buffer_bounded_on_large_stream(self):
+        """测试长内容流式解析时 buffer 始终短于一个标签字面量，内容逐块输出而不是积压"""
+        parser = StreamParser(tags={"think": "思考"}, enable_tags_streaming=True)
+        large_content = "<think>" + "内容 <th 1<2 </thin " * 2000 + "</think>"
+
+        partial_count = 0
+        chunk_size = 7
+        for i in range(0, len(large_content), chunk_size):
+            messages = parser.parse_chunk(large_content[i:i + chunk_size])
+            partial_count += sum(1 for msg in messages if not msg.is_complete)
+            assert len(parser.buffer) < parser._max_tag_len, "buffer 不应该超过一个标签字面量的长度"
+
+        assert parser.buffer == "" and parser.current_state == "IDLE"
+        assert partial_count > len(large_content) // chunk_size // 2, "内容应该随 chunk 逐步输出"
+
+    async def test_parsers_share_cached_config(self):
+        """测试相同标签配置的解析器共享同一份缓存配置，状态互不影响"""
+        tags = {"think": "思考", "tool": "工具调用"}
+        parser_a = StreamParser(tags=tags)
+        parser_b = StreamParser(tags=dict(tags), enable_tags_streaming=True)
+
+        assert parser_a._config is parser_b._config, "相同标签配置应该复用缓存"
+        assert StreamParser(tags={"think": "思考"})._config is not parser_a._config, "不同标签配置不应该共享"
+
+        parser_a.parse_chunk("<think>只属于a")
+        assert parser_b.current_state == "IDLE", "共享配置不应该共享解析状态"
+        assert parser_b.current_content == "", "共享配置不应该共享内容"
+
+        # 共享的公开映射是只读的，不能通过一个实例修改其他实例的配置
+        for shared in (parser_a.states, parser_a.tag_map, parser_a.state_to_step):
+            try:
+                shared["extra"] = "x"
+                assert False, "共享的配置映射应该是只读的"
+            except TypeError:
+                pass
+        assert "extra" not in parser_b.tag_map
+
+    async def test_reset_clears_parse_state(self):
+        """测试 reset 后解析器可以从头解析新的流"""
+        parser = StreamParser(tags={"think": "思考"})
+        parser.parse_chunk("<think>第一个流的思考</think><thi")
+        parser.reset()
+
+        assert parser.buffer == "" and parser.current_state == "IDLE"
+        messages = parser.parse_chunk("<think>第二个流</think>")
+        assert [(msg.step_name, msg.content, msg.step) for msg in messages] == [("思考", "第二个流", 1)], \
+            "reset 后step计数和缓冲区都应该从头开始"
+
 
 # 如果直接运行此文件，执行所有测试
 if __name__ == "__main__":
@@ -466,16 +650,28 @@ if __name__ == "__main__":
             test_instance.test_invalid_tag_name_empty,
             test_instance.test_invalid_tag_name_non_string,
             test_instance.test_invalid_tag_name_format,
+            test_instance.test_valid_tag_names,
             test_instance.test_invalid_step_name_empty,
             test_instance.test_invalid_step_name_non_string,
             test_instance.test_no_tags_defined,
+            test_instance.test_no_tags_emits_lt_immediately,
             test_instance.test_enable_tags_streaming_no_content_change,
             test_instance.test_process_llm_stream_function,
+            test_instance.test_streaming_step_counted_once_per_block,
+            test_instance.test_finalize_is_idempotent,
             test_instance.test_nested_tag_switch,
             test_instance.test_maybe_emit_partial_no_change,
             test_instance.test_maybe_emit_partial_empty_new_content,
             test_instance.test_tag_switch_with_old_content,
-            test_instance.test_process_llm_stream_with_final_message
+            test_instance.test_process_llm_stream_with_final_message,
+            test_instance.test_stray_lt_then_tag_across_chunks,
+            test_instance.test_no_empty_messages_emitted,
+            test_instance.test_every_split_point_gives_same_blocks,
+            test_instance.test_buffer_keeps_only_possible_tag_tail,
+            test_instance.test_non_tag_tail_not_held_back,
+            test_instance.test_buffer_bounded_on_large_stream,
+            test_instance.test_parsers_share_cached_config,
+            test_instance.test_reset_clears_parse_state
         ]
         
         for test in tests: